@@ -0,0 +1,72 @@
+"""Benchmark waktu start dan memori dasar per worker.
+
+Setiap percobaan berjalan di proses Python baru (seperti worker uvicorn yang baru start),
+lalu mengukur waktu `import main` dan RSS setelahnya, sebelum dan sesudah warm_up().
+
+    python bench_startup.py --runs 5
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+PROBE = r"""
+import json, sys, time
+
+def rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return None
+
+started = time.perf_counter()
+import main
+import_seconds = time.perf_counter() - started
+cold_rss = rss_mb()
+lazy = "yt_dlp" not in sys.modules
+
+warmup_seconds = main.warm_up()
+print(json.dumps({
+    "import_seconds": import_seconds,
+    "cold_rss_mb": cold_rss,
+    "yt_dlp_lazy": lazy,
+    "warmup_seconds": warmup_seconds,
+    "warm_rss_mb": rss_mb(),
+}))
+"""
+
+
+def run_probe():
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        check=True,
+        capture_output=True,
+        text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark waktu import dan RSS worker")
+    parser.add_argument("--runs", type=int, default=5, help="Jumlah proses yang diukur")
+    args = parser.parse_args()
+
+    results = [run_probe() for _ in range(args.runs)]
+
+    print(f"runs: {args.runs} | yt_dlp lazy saat import: {all(r['yt_dlp_lazy'] for r in results)}")
+    for key, unit in (
+        ("import_seconds", "s"),
+        ("cold_rss_mb", "MB"),
+        ("warmup_seconds", "s"),
+        ("warm_rss_mb", "MB"),
+    ):
+        values = [r[key] for r in results if r[key] is not None]
+        if values:
+            print(f"{key:>15}: median {statistics.median(values):.3f} {unit} | "
+                  f"min {min(values):.3f} | max {max(values):.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,51 @@
 from fastapi import FastAPI, Request, Query, BackgroundTasks
 from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-import yt_dlp
 import os
+import sys
 import asyncio
-from datetime import datetime
+import importlib
 from urllib.parse import quote
 import io
 import logging
-import subprocess
 import math
 import base64
-import requests  
+import json
+import queue
+import random
+import re
+import atexit
+import glob
+import contextvars
+from contextlib import asynccontextmanager, contextmanager
+from logging.handlers import QueueHandler, QueueListener
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Literal, Union
+from pydantic import BaseModel
+
+class LazyModule:
+    """Proxy modul yang baru di-import saat atribut pertama kali diakses, supaya start worker tetap ringan."""
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+    @property
+    def loaded(self):
+        return self._name in sys.modules
+
+yt_dlp = LazyModule("yt_dlp")
+requests = LazyModule("requests")
+
+_started_at = time.monotonic()
 
 SPOTIFY_CLIENT_ID = "spotify_client_id kalian "
 SPOTIFY_CLIENT_SECRET = "Spotify_client_secret kalian "
@@ -19,13 +53,211 @@ SPOTIFY_CLIENT_SECRET = "Spotify_client_secret kalian "
 SPOTIFY_TOKEN_URL = "https://accounts.spotify.com/api/token"
 SPOTIFY_API_URL = "https://api.spotify.com/v1"
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+ACCESS_LOG_SAMPLING = {
+    "/download/file/": float(os.getenv("ACCESS_LOG_SAMPLE_FILE", "0.1")),
+}
+
+class JsonAccessFormatter(logging.Formatter):
+    """Format record access log sebagai satu baris JSON."""
+    def format(self, record):
+        payload = {"ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"), **getattr(record, "access", {})}
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+# Semua handler log berjalan di thread QueueListener, event loop hanya memasukkan record ke antrean
+_log_queue = queue.SimpleQueue()
+_app_log_handler = logging.StreamHandler()
+_app_log_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+_app_log_handler.addFilter(lambda record: record.name != "access")
+_access_log_handler = logging.StreamHandler()
+_access_log_handler.setFormatter(JsonAccessFormatter())
+_access_log_handler.addFilter(lambda record: record.name == "access")
+_log_listener = QueueListener(_log_queue, _app_log_handler, _access_log_handler)
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
+_queue_handler = QueueHandler(_log_queue)
+_queue_handler.setFormatter(logging.Formatter('%(message)s'))
+logging.basicConfig(level=logging.INFO, handlers=[_queue_handler])
 logger = logging.getLogger(__name__)
+access_logger = logging.getLogger("access")
+
+_access_record = contextvars.ContextVar("access_record", default=None)
+
+def record_access(**fields):
+    """Tambahkan field ke access log request yang sedang berjalan (jika ada)."""
+    record = _access_record.get()
+    if record is not None:
+        record.update(fields)
+
+@contextmanager
+def access_stage(name):
+    """Catat durasi satu tahap (extract, download, ...) ke access log request."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record = _access_record.get()
+        if record is not None:
+            record.setdefault("stages", {})[name] = round((time.perf_counter() - started) * 1000, 3)
+
+async def run_blocking(func, *args, executor=None):
+    """run_in_executor yang ikut membawa context request, supaya access log tetap terisi dari thread worker."""
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(executor, ctx.run, func, *args)
+
+_MEDIA_ID_PATTERNS = (
+    ("youtube", re.compile(r"(?:v=|youtu\.be/|shorts/|embed/)([\w-]{11})")),
+    ("spotify", re.compile(r"open\.spotify\.com/(?:intl-\w+/)?((?:track|album|playlist)/\w+)")),
+)
+
+def media_key(url):
+    """ID ringkas untuk URL YouTube/Spotify (misal "youtube:dQw4w9WgXcQ"), atau None."""
+    if not url:
+        return None
+    for source, pattern in _MEDIA_ID_PATTERNS:
+        match = pattern.search(url)
+        if match:
+            return f"{source}:{match.group(1)}"
+    return None
+
+RETRY_ATTEMPTS = 3
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 4.0
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_RESET_TIMEOUT = 30
+SPOTIFY_TIMEOUT = 10
+
+class UpstreamUnavailable(Exception):
+    """Upstream (YouTube/Spotify) sedang bermasalah; klien sebaiknya mencoba lagi setelah retry_after detik."""
+    def __init__(self, message, retry_after=CIRCUIT_RESET_TIMEOUT):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class UpstreamHTTPError(Exception):
+    """Respons HTTP 429/5xx dari upstream yang layak dicoba ulang."""
+    def __init__(self, response):
+        super().__init__(f"HTTP {response.status_code}")
+        self.response = response
+
+class CircuitBreaker:
+    """Circuit breaker per upstream: terbuka setelah sejumlah kegagalan beruntun, lalu
+    mengizinkan satu percobaan (half-open) setelah reset_timeout."""
+    def __init__(self, name, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_timeout=CIRCUIT_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_timeout and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def retry_after(self):
+        with self.lock:
+            if self.opened_at is None:
+                return 0
+            return max(1, int(self.reset_timeout - (time.monotonic() - self.opened_at)))
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial_in_flight = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logger.warning(f"circuit | {self.name} terbuka setelah {self.failures} kegagalan beruntun")
+                self.opened_at = time.monotonic()
+
+circuit_breakers = {
+    "youtube": CircuitBreaker("youtube"),
+    "spotify": CircuitBreaker("spotify"),
+}
+
+_RETRYABLE_MESSAGES = (
+    "http error 429", "too many requests", "http error 5", "timed out", "timeout",
+    "temporary failure", "connection reset", "connection refused", "remote end closed",
+)
+
+def is_retryable_error(e):
+    """Error sementara dari upstream (throttling, 5xx, jaringan) yang layak dicoba ulang."""
+    if isinstance(e, UpstreamHTTPError):
+        return True
+    # Hanya cek tipe dari modul yang sudah dimuat, jangan memicu import hanya untuk isinstance
+    if requests.loaded and isinstance(e, (requests.ConnectionError, requests.Timeout)):
+        return True
+    # Throttle/sign-in melekat pada identitas cookie: layak diulang selama masih ada identitas lain yang sehat
+    if is_identity_error(e) and get_cookie_pool().has_healthy():
+        return True
+    return (
+        yt_dlp.loaded
+        and isinstance(e, yt_dlp.utils.DownloadError)
+        and any(m in str(e).lower() for m in _RETRYABLE_MESSAGES)
+    )
+
+def call_with_retry(upstream, func, *args, **kwargs):
+    """Panggil func dengan retry jittered exponential backoff dan circuit breaker milik upstream.
+
+    Error yang tidak bisa dicoba ulang (misal video privat) langsung diteruskan tanpa
+    menghitung sebagai kegagalan upstream. Jika circuit terbuka atau retry habis, raise
+    UpstreamUnavailable. Dipanggil dari thread worker, bukan event loop.
+    """
+    breaker = circuit_breakers[upstream]
+    if not breaker.allow():
+        raise UpstreamUnavailable(f"{upstream} sedang tidak tersedia, coba lagi nanti.", breaker.retry_after())
+
+    for attempt in range(RETRY_ATTEMPTS):
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            if not is_retryable_error(e):
+                # Bot-check/throttle tanpa identitas cadangan bukan tanda upstream sehat
+                if not is_identity_error(e):
+                    breaker.record_success()
+                raise
+            breaker.record_failure()
+            if attempt == RETRY_ATTEMPTS - 1 or not breaker.allow():
+                raise UpstreamUnavailable(f"{upstream} sedang bermasalah: {e}", breaker.retry_after() or CIRCUIT_RESET_TIMEOUT) from e
+            delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+            logger.warning(f"retry | {upstream} | Percobaan {attempt + 1} gagal: {e} | Ulangi dalam {delay:.2f} detik")
+            time.sleep(delay)
+        else:
+            breaker.record_success()
+            return result
+
+def error_response(e):
+    """Respons error umum; 503 + Retry-After jika upstream sedang bermasalah agar klien tidak langsung mengulang."""
+    if isinstance(e, UpstreamUnavailable):
+        return JSONResponse(status_code=503, content={"error": str(e)}, headers={"Retry-After": str(e.retry_after)})
+    return JSONResponse(status_code=500, content={"error": str(e)})
+
+@asynccontextmanager
+async def lifespan(app):
+    tasks = start_background_tasks()
+    try:
+        yield
+    finally:
+        for task in tasks:
+            task.cancel()
 
 app = FastAPI(
     title="YouTube dan Spotify Downloader API",
     description="API untuk mengunduh video dan audio dari YouTube dan Spotify.",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=lifespan
 )
 
 app.add_middleware(
@@ -38,10 +270,515 @@ app.add_middleware(
 
 OUTPUT_DIR = "output"
 SPOTIFY_OUTPUT_DIR = "spotify_output"
-os.makedirs(OUTPUT_DIR, exist_ok=True)
-os.makedirs(SPOTIFY_OUTPUT_DIR, exist_ok=True)
 
 COOKIES_FILE = "yt.txt"
+COOKIES_DIR = "cookies"
+COOKIE_COOLDOWN_BASE = 60
+COOKIE_COOLDOWN_MAX = 1800
+
+INFO_CACHE_TTL = 600
+INFO_CACHE_STALE_TTL = 6 * 3600
+INFO_CACHE_MAX_ITEMS = 512
+INFO_BATCH_MAX_URLS = 200
+INFO_BATCH_CONCURRENCY = 8
+
+# Batas biaya unduhan, dicek sebelum ada byte yang diunduh
+MAX_DOWNLOAD_MB = int(os.getenv("MAX_DOWNLOAD_MB", "1024"))
+MAX_DURATION_SECONDS = int(os.getenv("MAX_DURATION_SECONDS", str(3 * 3600)))
+MAX_PLAYLIST_ITEMS = int(os.getenv("MAX_PLAYLIST_ITEMS", "25"))
+
+# Prefetch konten populer saat server sedang sepi
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "1") == "1"
+PREFETCH_TOP_N = int(os.getenv("PREFETCH_TOP_N", "10"))
+PREFETCH_MIN_HITS = 3
+PREFETCH_INTERVAL = 60
+PREFETCH_IDLE_MAX_INFLIGHT = 2
+PREFETCH_JOBS_PER_CYCLE = 3
+PREFETCH_MAX_TRACKED = int(os.getenv("PREFETCH_MAX_TRACKED", "5000"))
+PREFETCH_DISK_BUDGET_MB = int(os.getenv("PREFETCH_DISK_BUDGET_MB", "2048"))
+
+# Default lean: yt_dlp baru dimuat saat request pertama. Set 1 agar dimuat di latar belakang saat start
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "0") == "1"
+
+_info_cache = OrderedDict()
+_info_cache_lock = threading.Lock()
+# Ekstraksi yang sedang berjalan per cache key, supaya permintaan bersamaan cukup menunggu satu ekstraksi
+_info_inflight = {}
+info_executor = ThreadPoolExecutor(max_workers=INFO_BATCH_CONCURRENCY, thread_name_prefix="info")
+
+def seconds_to_hms(seconds):
+    h = seconds // 3600
+    m = (seconds % 3600) // 60
+    s = seconds % 60
+    return f"{int(h):02}:{int(m):02}:{int(s):02}"
+
+class FormatSummary:
+    """Ringkasan ringkas info["formats"]: satu baris terbaik per (resolusi, ext, codec) dan daftar audio.
+
+    Disimpan sebagai array paralel supaya cache metadata tidak perlu menahan dict info mentah.
+    """
+    __slots__ = (
+        "heights", "tbrs", "sizes", "exts", "vcodecs", "format_ids", "total_mp4_size",
+        "audio_bitrates", "audio_sizes", "audio_exts", "audio_format_ids",
+    )
+
+    def __init__(self, formats):
+        video_rows = {}
+        audio_rows = {}
+        total_mp4_size = 0
+
+        for fmt in formats or []:
+            # Beberapa extractor memberi ukuran/tinggi float, sedangkan array "q"/"H" butuh int
+            size = int(fmt.get("filesize") or fmt.get("filesize_approx") or 0)
+            vcodec = fmt.get("vcodec") or "none"
+            ext = fmt.get("ext") or "Unknown"
+
+            if vcodec != "none":
+                if ext == "mp4":
+                    total_mp4_size += size
+                if not fmt.get("height"):
+                    continue
+                tbr = fmt.get("tbr") or 0
+                key = (int(fmt["height"]), ext, vcodec.split(".")[0])
+                current = video_rows.get(key)
+                if current is None or (tbr, size) >= (current[0], current[1]):
+                    video_rows[key] = (tbr, size, fmt.get("format_id"))
+            elif fmt.get("acodec") not in (None, "none"):
+                abr = fmt.get("abr") or fmt.get("tbr") or 0
+                key = (ext, round(abr))
+                current = audio_rows.get(key)
+                if current is None or size > current[0]:
+                    audio_rows[key] = (size, fmt.get("format_id"))
+
+        video_keys = sorted(video_rows, key=lambda k: (k[0], video_rows[k][0]))
+        self.heights = array("H", (k[0] for k in video_keys))
+        self.tbrs = array("f", (video_rows[k][0] for k in video_keys))
+        self.sizes = array("q", (video_rows[k][1] for k in video_keys))
+        self.exts = tuple(k[1] for k in video_keys)
+        self.vcodecs = tuple(k[2] for k in video_keys)
+        self.format_ids = tuple(video_rows[k][2] for k in video_keys)
+        self.total_mp4_size = total_mp4_size
+
+        audio_keys = sorted(audio_rows, key=lambda k: k[1])
+        self.audio_bitrates = array("f", (k[1] for k in audio_keys))
+        self.audio_sizes = array("q", (audio_rows[k][0] for k in audio_keys))
+        self.audio_exts = tuple(k[0] for k in audio_keys)
+        self.audio_format_ids = tuple(audio_rows[k][1] for k in audio_keys)
+
+    def resolutions(self):
+        """Satu entri per resolusi (format dengan bitrate tertinggi), urut dari resolusi terendah."""
+        best = {}
+        for i, height in enumerate(self.heights):
+            if height not in best or self.tbrs[i] >= self.tbrs[best[height]]:
+                best[height] = i
+        return [
+            {
+                "resolution": f"{height}p",
+                "ext": self.exts[i],
+                "size": round(self.sizes[i] / 1024 / 1024, 2) if self.sizes[i] else "Unknown"
+            }
+            for height, i in sorted(best.items())
+        ]
+
+    def best_video(self, max_height, ext="mp4"):
+        """Index baris video terbaik dengan tinggi <= max_height, atau None."""
+        candidates = [
+            i for i, height in enumerate(self.heights)
+            if height <= max_height and (ext is None or self.exts[i] == ext)
+        ]
+        if not candidates:
+            return None
+        return max(candidates, key=lambda i: (self.heights[i], self.tbrs[i]))
+
+    def best_audio(self, ext="m4a"):
+        """Index audio dengan bitrate tertinggi, atau None."""
+        candidates = [i for i, e in enumerate(self.audio_exts) if ext is None or e == ext]
+        if not candidates:
+            return None
+        return max(candidates, key=lambda i: self.audio_bitrates[i])
+
+class InfoSummary:
+    """Metadata video tunggal yang disimpan di cache, berisi FormatSummary alih-alih dict info mentah."""
+    __slots__ = (
+        "id", "title", "channel", "channel_url", "duration", "is_live", "thumbnail",
+        "webpage_url", "subtitle_languages", "formats",
+    )
+    is_playlist = False
+
+    def __init__(self, info):
+        self.id = info.get("id")
+        self.title = info.get("title")
+        self.channel = info.get("channel")
+        self.channel_url = info.get("channel_url")
+        self.duration = info.get("duration") or 0
+        self.is_live = bool(info.get("is_live"))
+        self.thumbnail = info.get("thumbnail")
+        self.webpage_url = info.get("webpage_url")
+        subtitles = info.get("subtitles") or {}
+        auto_captions = info.get("automatic_captions") or {}
+        self.subtitle_languages = tuple(set(subtitles) | set(auto_captions))
+        self.formats = FormatSummary(info.get("formats"))
+
+class PlaylistSummary:
+    """Metadata playlist yang disimpan di cache; entri disimpan sebagai tuple
+    (playlist_index, title, url, duration, thumbnail)."""
+    __slots__ = (
+        "id", "title", "uploader", "uploader_url", "webpage_url", "playlist_count", "entries",
+    )
+    is_playlist = True
+
+    def __init__(self, info):
+        self.id = info.get("id")
+        self.title = info.get("title", "Unknown Playlist")
+        self.uploader = info.get("uploader")
+        self.uploader_url = info.get("uploader_url")
+        self.webpage_url = info.get("webpage_url")
+        self.playlist_count = info.get("playlist_count")
+
+        entries = []
+        for v in info.get("entries") or []:
+            if not v:
+                entries.append(None)
+                continue
+            # Entri hasil ekstraksi datar hanya punya "url" dan daftar "thumbnails"
+            thumbnails = v.get("thumbnails") or [{}]
+            entries.append((
+                v.get("playlist_index"),
+                v.get("title", "Unknown"),
+                v.get("webpage_url") or v.get("url", "Unknown"),
+                v.get("duration", 0),
+                v.get("thumbnail") or thumbnails[-1].get("url"),
+            ))
+        self.entries = tuple(entries)
+
+def summarize_info(info):
+    if "entries" in info:
+        return PlaylistSummary(info)
+    return InfoSummary(info)
+
+def store_info_summary(cache_key, summary):
+    with _info_cache_lock:
+        _info_cache[cache_key] = (time.monotonic() + INFO_CACHE_TTL, summary)
+        _info_cache.move_to_end(cache_key)
+        while len(_info_cache) > INFO_CACHE_MAX_ITEMS:
+            _info_cache.popitem(last=False)
+
+def get_cached_summary(url, flat=False, playlist_items=None, allow_stale=False):
+    """Ambil ringkasan dari cache tanpa memicu ekstraksi; None jika belum ada atau kedaluwarsa.
+
+    allow_stale=True juga mengembalikan entri yang sudah lewat TTL (hingga INFO_CACHE_STALE_TTL),
+    dipakai saat upstream sedang bermasalah.
+    """
+    cache_key = (url, flat, playlist_items)
+    grace = INFO_CACHE_STALE_TTL if allow_stale else 0
+    with _info_cache_lock:
+        cached = _info_cache.get(cache_key)
+        if cached and cached[0] + grace > time.monotonic():
+            _info_cache.move_to_end(cache_key)
+            return cached[1]
+    return None
+
+def select_video_format(url, resolution):
+    """Pilih format_id pasti dari ringkasan di cache (jika ada), dengan selector umum sebagai cadangan."""
+    fallback = f'bestvideo[height<={resolution}][ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best'
+    summary = get_cached_summary(url)
+    if summary is None or summary.is_playlist:
+        return fallback
+
+    formats = summary.formats
+    video_idx = formats.best_video(resolution)
+    audio_idx = formats.best_audio()
+    if video_idx is None or audio_idx is None:
+        return fallback
+    return f"{formats.format_ids[video_idx]}+{formats.audio_format_ids[audio_idx]}/{fallback}"
+
+class DownloadLimitExceeded(Exception):
+    """Permintaan unduhan melebihi batas ukuran/durasi yang dikonfigurasi."""
+
+class PlaylistNotSupported(Exception):
+    """URL mengarah ke playlist padahal endpoint hanya menerima video tunggal."""
+
+def estimate_download_cost(summary, resolution=None, clip_range=None):
+    """Perkirakan durasi dan ukuran unduhan dari InfoSummary. resolution=None berarti audio saja."""
+    formats = summary.formats
+    # Livestream tidak punya durasi akhir yang pasti, anggap tidak diketahui
+    duration = 0 if summary.is_live else summary.duration or 0
+    clip_duration = duration
+    bounded_clip = bool(clip_range) and clip_range[1] != math.inf
+    if clip_range:
+        start_sec, end_sec = clip_range
+        if duration:
+            end_sec = min(end_sec, duration)
+        clip_duration = max(0, end_sec - start_sec) if end_sec != math.inf else 0
+    ratio = clip_duration / duration if duration else 1
+
+    def row_bytes(size, kbps):
+        if size:
+            return size * ratio
+        return kbps * 1000 / 8 * clip_duration
+
+    audio_bytes = 0
+    audio_idx = formats.best_audio()
+    if audio_idx is None:
+        audio_idx = formats.best_audio(ext=None)
+    if audio_idx is not None:
+        audio_bytes = row_bytes(formats.audio_sizes[audio_idx], formats.audio_bitrates[audio_idx])
+
+    video_bytes = 0
+    height = None
+    if resolution is not None:
+        video_idx = formats.best_video(resolution)
+        if video_idx is None:
+            video_idx = formats.best_video(resolution, ext=None)
+        if video_idx is not None:
+            video_bytes = row_bytes(formats.sizes[video_idx], formats.tbrs[video_idx])
+            height = formats.heights[video_idx]
+
+    size_bytes = int(video_bytes + audio_bytes)
+    return {
+        "duration": clip_duration or None,
+        "bounded_clip": bounded_clip,
+        "resolution": height,
+        "size_bytes": size_bytes or None,
+        "size_mb": round(size_bytes / 1024 / 1024, 2) if size_bytes else "Unknown",
+    }
+
+def check_download_limits(estimate):
+    """Kembalikan alasan penolakan, atau None jika estimasi masih dalam batas.
+
+    Durasi/ukuran yang tidak diketahui (misal livestream) ditolak kecuali rentang klip dibatasi start/end.
+    """
+    if estimate["duration"] is None:
+        return "Durasi tidak diketahui (misalnya livestream). Batasi rentang unduhan dengan start dan end."
+    if estimate["size_bytes"] is None and not estimate["bounded_clip"]:
+        return "Ukuran unduhan tidak dapat diperkirakan. Batasi rentang unduhan dengan start dan end."
+    if estimate["duration"] > MAX_DURATION_SECONDS:
+        return f"Durasi {seconds_to_hms(estimate['duration'])} melebihi batas {seconds_to_hms(MAX_DURATION_SECONDS)}."
+    if estimate["size_bytes"] and estimate["size_bytes"] > MAX_DOWNLOAD_MB * 1024 * 1024:
+        return f"Perkiraan ukuran {estimate['size_mb']} MB melebihi batas {MAX_DOWNLOAD_MB} MB."
+    return None
+
+def suggest_resolution(summary, resolution, clip_range=None):
+    """Resolusi tertinggi (<= resolution) yang perkiraan ukurannya masih dalam batas, atau None."""
+    for height in sorted(set(summary.formats.heights), reverse=True):
+        if height > resolution:
+            continue
+        if check_download_limits(estimate_download_cost(summary, height, clip_range)) is None:
+            return height
+    return None
+
+def enforce_download_limits(summary, resolution=None, clip_range=None, allow_downgrade=False):
+    """Cek batas sebelum mengunduh. Mengembalikan resolusi yang dipakai (bisa diturunkan jika
+    allow_downgrade), atau raise DownloadLimitExceeded / PlaylistNotSupported."""
+    if summary.is_playlist:
+        raise PlaylistNotSupported("URL playlist tidak didukung di endpoint ini. Gunakan /download/playlist.")
+
+    reason = check_download_limits(estimate_download_cost(summary, resolution, clip_range))
+    if reason is None:
+        return resolution
+
+    if allow_downgrade and resolution is not None:
+        downgraded = suggest_resolution(summary, resolution, clip_range)
+        if downgraded is not None:
+            logger.info(f"limits | {summary.webpage_url} | Resolusi diturunkan {resolution}p -> {downgraded}p")
+            return downgraded
+
+    raise DownloadLimitExceeded(reason)
+
+def playlist_guard_opts(ydl_opts):
+    """Tambahkan filter yt_dlp agar entri playlist/pencarian yang terlalu panjang atau besar dilewati."""
+    ydl_opts['match_filter'] = yt_dlp.utils.match_filter_func(f"duration <=? {MAX_DURATION_SECONDS}")
+    ydl_opts['max_filesize'] = MAX_DOWNLOAD_MB * 1024 * 1024
+    return ydl_opts
+
+def extract_info_cached(url, flat=False, playlist_items=None, refresh=False):
+    """extract_info tanpa download, diringkas lalu disimpan di cache LRU dengan TTL
+    agar URL yang sama tidak diekstrak ulang.
+
+    flat=True memakai ekstraksi playlist datar (tanpa membuka tiap video), playlist_items
+    membatasi entri yang diambil (format yt_dlp, misal "1:50"). refresh=True selalu
+    mengekstrak ulang dan memperbarui cache.
+    """
+    if not refresh:
+        summary = get_cached_summary(url, flat, playlist_items)
+        record_access(cache_hit=summary is not None)
+        if summary is not None:
+            return summary
+
+    cache_key = (url, flat, playlist_items)
+    with _info_cache_lock:
+        pending = _info_inflight.get(cache_key)
+        is_owner = pending is None
+        if is_owner:
+            pending = _info_inflight[cache_key] = Future()
+
+    if not is_owner:
+        return pending.result()
+
+    try:
+        summary = _extract_and_store(url, flat, playlist_items)
+    except BaseException as e:
+        pending.set_exception(e)
+        raise
+    else:
+        pending.set_result(summary)
+        return summary
+    finally:
+        with _info_cache_lock:
+            _info_inflight.pop(cache_key, None)
+
+def _extract_and_store(url, flat, playlist_items):
+    ydl_opts = {'quiet': True}
+    if flat:
+        ydl_opts['extract_flat'] = 'in_playlist'
+        ydl_opts['lazy_playlist'] = True
+    if playlist_items:
+        ydl_opts['playlist_items'] = playlist_items
+
+    try:
+        info = extract_with_retry(ydl_opts, url)
+    except UpstreamUnavailable:
+        stale = get_cached_summary(url, flat, playlist_items, allow_stale=True)
+        if stale is None:
+            raise
+        logger.warning(f"info | URL: {url} | Upstream bermasalah, memakai metadata lama dari cache")
+        record_access(stale=True)
+        return stale
+
+    summary = summarize_info(info)
+    store_info_summary((url, flat, playlist_items), summary)
+    return summary
+
+_THROTTLE_MESSAGES = ("http error 429", "too many requests", "rate-limit", "rate limit")
+_SIGNIN_MESSAGES = ("sign in to confirm", "not a bot", "cookies are no longer valid", "login required")
+
+def is_identity_error(error):
+    """Error throttle/sign-in yang disebabkan identitas cookie, bukan oleh video itu sendiri."""
+    messages = f"{error} {error.__cause__ or ''}".lower()
+    return any(m in messages for m in _THROTTLE_MESSAGES + _SIGNIN_MESSAGES)
+
+class CookiePool:
+    """Pool identitas cookie yt_dlp. Identitas dipilih least-recently-used dari yang sehat;
+    identitas yang kena throttle/sign-in didinginkan dengan cooldown yang makin panjang."""
+    def __init__(self, paths):
+        self.lock = threading.Lock()
+        self.identities = {
+            path: {"last_used": 0.0, "cooldown_until": 0.0, "failures": 0, "uses": 0}
+            for path in paths
+        }
+
+    def acquire(self):
+        with self.lock:
+            if not self.identities:
+                return None
+            now = time.monotonic()
+            healthy = [p for p, state in self.identities.items() if state["cooldown_until"] <= now]
+            if healthy:
+                path = min(healthy, key=lambda p: self.identities[p]["last_used"])
+            else:
+                # Semua sedang cooldown: pakai yang paling cepat pulih daripada gagal total
+                path = min(self.identities, key=lambda p: self.identities[p]["cooldown_until"])
+            state = self.identities[path]
+            state["last_used"] = now
+            state["uses"] += 1
+            return path
+
+    def report_failure(self, path, error):
+        """Catat error dari identitas ini; hanya throttle/sign-in yang memicu cooldown."""
+        if not is_identity_error(error):
+            return
+        with self.lock:
+            state = self.identities.get(path)
+            if state is None:
+                return
+            state["failures"] += 1
+            cooldown = min(COOKIE_COOLDOWN_MAX, COOKIE_COOLDOWN_BASE * 2 ** (state["failures"] - 1))
+            state["cooldown_until"] = time.monotonic() + cooldown
+        logger.warning(f"cookies | {path} didinginkan {cooldown} detik: {error}")
+
+    def has_healthy(self):
+        """True jika masih ada identitas yang tidak sedang cooldown."""
+        now = time.monotonic()
+        with self.lock:
+            return any(state["cooldown_until"] <= now for state in self.identities.values())
+
+    def report_success(self, path):
+        with self.lock:
+            state = self.identities.get(path)
+            if state is not None and state["cooldown_until"] <= time.monotonic():
+                state["failures"] = 0
+
+    @contextmanager
+    def identity(self):
+        path = self.acquire()
+        try:
+            yield path
+        except Exception as e:
+            self.report_failure(path, e)
+            raise
+        else:
+            self.report_success(path)
+
+    def stats(self):
+        now = time.monotonic()
+        with self.lock:
+            return [
+                {
+                    "cookiefile": path,
+                    "healthy": state["cooldown_until"] <= now,
+                    "cooldown_remaining": max(0, round(state["cooldown_until"] - now)),
+                    "failures": state["failures"],
+                    "uses": state["uses"],
+                }
+                for path, state in self.identities.items()
+            ]
+
+def discover_cookie_files():
+    """File cookie dari env COOKIES_FILES (dipisah koma), atau semua *.txt di COOKIES_DIR, plus COOKIES_FILE."""
+    configured = os.getenv("COOKIES_FILES")
+    paths = configured.split(",") if configured else sorted(glob.glob(os.path.join(COOKIES_DIR, "*.txt")))
+    if os.path.exists(COOKIES_FILE):
+        paths.append(COOKIES_FILE)
+    return list(dict.fromkeys(p.strip() for p in paths if p.strip()))
+
+_cookie_pool = None
+_cookie_pool_lock = threading.Lock()
+
+def get_cookie_pool():
+    """CookiePool dibuat saat pertama kali dibutuhkan."""
+    global _cookie_pool
+    if _cookie_pool is None:
+        with _cookie_pool_lock:
+            if _cookie_pool is None:
+                _cookie_pool = CookiePool(discover_cookie_files())
+    return _cookie_pool
+
+@contextmanager
+def open_youtube_dl(ydl_opts):
+    """yt_dlp.YoutubeDL dengan identitas cookie dari pool."""
+    with get_cookie_pool().identity() as cookiefile:
+        with yt_dlp.YoutubeDL({**ydl_opts, 'cookiefile': cookiefile}) as ydl:
+            yield ydl
+
+def youtube_with_retry(ydl_opts, func):
+    """Jalankan func(ydl) lewat call_with_retry. Tiap percobaan membuka YoutubeDL baru dengan identitas
+    yang diambil ulang dari pool, jadi identitas yang kena throttle/sign-in tidak dipakai lagi."""
+    def attempt():
+        with open_youtube_dl(ydl_opts) as ydl:
+            return func(ydl)
+
+    return call_with_retry("youtube", attempt)
+
+def extract_with_retry(ydl_opts, url, download=False):
+    return youtube_with_retry(ydl_opts, lambda ydl: ydl.extract_info(url, download=download))
+
+def download_with_retry(ydl_opts, urls):
+    return youtube_with_retry(ydl_opts, lambda ydl: ydl.download(urls))
+
+def extract_for_download(ydl_opts, url):
+    """Ekstraksi sebelum unduh. Dengan extract_flat='in_playlist' entri playlist tidak dibuka satu
+    per satu, jadi URL playlist bisa ditolak murah; video tunggal tetap diekstrak penuh."""
+    return extract_with_retry({**ydl_opts, 'extract_flat': 'in_playlist'}, url)
 
 async def delete_file_after_delay(file_path: str, delay: int = 600):
     await asyncio.sleep(delay)
@@ -53,6 +790,221 @@ async def delete_file_after_delay(file_path: str, delay: int = 600):
     except Exception as e:
         logger.error(f"Gagal menghapus file {file_path}: {e}")
 
+def parse_clip_range(start, end):
+    """Ubah parameter start/end (detik atau HH:MM:SS) menjadi tuple detik, atau None jika tidak dipotong."""
+    if not start and not end:
+        return None
+
+    start_sec = yt_dlp.utils.parse_duration(start) if start else 0
+    end_sec = yt_dlp.utils.parse_duration(end) if end else math.inf
+
+    if start_sec is None or end_sec is None:
+        raise ValueError("Format start/end tidak valid. Gunakan detik (90) atau HH:MM:SS (00:01:30).")
+    if end_sec <= start_sec:
+        raise ValueError("Nilai end harus lebih besar dari start.")
+
+    return start_sec, end_sec
+
+def apply_clip_range(ydl_opts, clip_range):
+    """Tambahkan opsi yt_dlp agar hanya rentang waktu yang diminta yang diunduh."""
+    if not clip_range:
+        return ydl_opts
+
+    ydl_opts['download_ranges'] = yt_dlp.utils.download_range_func(None, [clip_range])
+    # Potong di keyframe terdekat supaya ffmpeg cukup stream copy tanpa re-encode
+    ydl_opts['force_keyframes_at_cuts'] = False
+    return ydl_opts
+
+def clip_suffix(clip_range):
+    if not clip_range:
+        return ""
+    start_sec, end_sec = clip_range
+    end_label = "end" if end_sec == math.inf else f"{end_sec:g}"
+    return f"_clip{start_sec:g}-{end_label}"
+
+_request_counts = {}
+_prefetch_artifacts = {}
+_inflight_requests = 0
+prefetch_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+
+def record_media_request(url, query=None):
+    """Catat permintaan unduhan untuk menentukan item populer. query dipakai untuk track Spotify
+    (pencarian YouTube yang sesuai)."""
+    if not PREFETCH_ENABLED:
+        return
+    key = media_key(url)
+    if key is None:
+        return
+    if key not in _request_counts and len(_request_counts) >= PREFETCH_MAX_TRACKED:
+        # Batas keras jumlah key: buang yang skornya paling rendah
+        del _request_counts[min(_request_counts, key=lambda k: _request_counts[k]["score"])]
+    entry = _request_counts.setdefault(key, {"url": url, "query": query, "score": 0.0})
+    entry["score"] += 1
+    if query:
+        entry["query"] = query
+
+def get_prefetched(url, kind):
+    """Artefak prefetch ("mp3" 128k / "mp4" 720p) untuk URL ini, atau None jika belum tersedia."""
+    artifact = _prefetch_artifacts.get((media_key(url), kind))
+    if artifact and os.path.exists(artifact["path"]):
+        return artifact
+    return None
+
+def produce_prefetch_artifact(key, target, kind):
+    """Unduh dan konversi satu artefak prefetch. Dijalankan di prefetch_executor (satu thread)
+    supaya pemakaian CPU tetap terbatas."""
+    source, media_id = key.split(":", 1)
+    suffix = "128k.mp3" if kind == "mp3" else "720p.mp4"
+    path = os.path.join(OUTPUT_DIR, f"prefetch_{source}_{media_id.replace('/', '_')}_{suffix}")
+    ydl_opts = {
+        'quiet': True,
+        'no_warnings': True,
+        'noplaylist': True,
+        'outtmpl': os.path.splitext(path)[0] + '.%(ext)s',
+    }
+    if kind == "mp3":
+        ydl_opts.update({
+            'format': 'bestaudio/best',
+            'postprocessors': [{
+                'key': 'FFmpegExtractAudio',
+                'preferredcodec': 'mp3',
+                'preferredquality': '128',
+            }],
+            'postprocessor_args': ['-vn', '-threads', '1'],
+        })
+    else:
+        ydl_opts.update({
+            'format': 'bestvideo[height<=720][ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best',
+            'merge_output_format': 'mp4',
+        })
+    playlist_guard_opts(ydl_opts)
+
+    info = extract_with_retry(ydl_opts, target, download=True)
+    entry = (info.get('entries') or [None])[0] if 'entries' in info else info
+
+    if not entry or not os.path.exists(path):
+        return None
+    return {
+        "path": path,
+        "title": entry.get("title"),
+        "thumbnail": entry.get("thumbnail"),
+        "size": os.path.getsize(path),
+    }
+
+def enforce_prefetch_budget():
+    """Hapus artefak prefetch dengan skor terendah sampai total ukuran di bawah PREFETCH_DISK_BUDGET_MB."""
+    budget = PREFETCH_DISK_BUDGET_MB * 1024 * 1024
+    total = sum(artifact["size"] for artifact in _prefetch_artifacts.values())
+    by_score = sorted(
+        _prefetch_artifacts,
+        key=lambda item: _request_counts.get(item[0], {}).get("score", 0)
+    )
+    for item in by_score:
+        if total <= budget:
+            break
+        artifact = _prefetch_artifacts.pop(item)
+        total -= artifact["size"]
+        try:
+            os.remove(artifact["path"])
+        except FileNotFoundError:
+            pass
+
+async def run_prefetch_cycle():
+    loop = asyncio.get_running_loop()
+    hot = sorted(
+        (item for item in _request_counts.items() if item[1]["score"] >= PREFETCH_MIN_HITS),
+        key=lambda item: item[1]["score"],
+        reverse=True
+    )[:PREFETCH_TOP_N]
+
+    jobs = 0
+    for key, entry in hot:
+        if _inflight_requests > PREFETCH_IDLE_MAX_INFLIGHT:
+            return
+        is_youtube = key.startswith("youtube:")
+        if is_youtube:
+            # Segarkan metadata yang sudah kedaluwarsa supaya permintaan berikutnya tidak membayar ekstraksi penuh
+            if get_cached_summary(entry["url"]) is None:
+                try:
+                    await loop.run_in_executor(prefetch_executor, extract_info_cached, entry["url"], False, None, True)
+                except Exception as e:
+                    logger.warning(f"prefetch | {key} metadata | Error: {e}")
+                    continue
+            target = entry["url"]
+        elif entry["query"]:
+            target = f"ytsearch1:{entry['query']}"
+        else:
+            continue
+
+        for kind in ("mp3", "mp4") if is_youtube else ("mp3",):
+            if jobs >= PREFETCH_JOBS_PER_CYCLE or _inflight_requests > PREFETCH_IDLE_MAX_INFLIGHT:
+                return
+            if (key, kind) in _prefetch_artifacts and os.path.exists(_prefetch_artifacts[(key, kind)]["path"]):
+                continue
+            jobs += 1
+            try:
+                artifact = await loop.run_in_executor(prefetch_executor, produce_prefetch_artifact, key, target, kind)
+            except Exception as e:
+                logger.warning(f"prefetch | {key} {kind} | Error: {e}")
+                continue
+            if artifact:
+                _prefetch_artifacts[(key, kind)] = artifact
+                logger.info(f"prefetch | {key} {kind} | {artifact['size']} bytes")
+                enforce_prefetch_budget()
+
+def decay_request_counts():
+    """Peluruhan skor agar item yang sudah tidak populer tergeser dan keluar dari _request_counts."""
+    prefetched_keys = {item[0] for item in _prefetch_artifacts}
+    for key in list(_request_counts):
+        _request_counts[key]["score"] /= 2
+        if _request_counts[key]["score"] < 0.5 and key not in prefetched_keys:
+            del _request_counts[key]
+
+async def prefetch_loop():
+    while True:
+        await asyncio.sleep(PREFETCH_INTERVAL)
+        if _inflight_requests <= PREFETCH_IDLE_MAX_INFLIGHT:
+            try:
+                await run_prefetch_cycle()
+            except Exception as e:
+                logger.error(f"prefetch | Error: {e}", exc_info=True)
+        # Tetap meluruh saat sibuk, justru saat itulah _request_counts tumbuh paling cepat
+        decay_request_counts()
+
+_runtime_state = {"output_dirs": False, "warmup": "skipped", "warmup_seconds": None}
+
+def ensure_output_dirs():
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    os.makedirs(SPOTIFY_OUTPUT_DIR, exist_ok=True)
+    _runtime_state["output_dirs"] = True
+
+def warm_up():
+    """Muat yt_dlp dan cookie pool lebih awal supaya request pertama tidak menanggung biaya import."""
+    started = time.perf_counter()
+    yt_dlp.YoutubeDL
+    requests.Session
+    get_cookie_pool()
+    return round(time.perf_counter() - started, 3)
+
+async def run_warm_up():
+    try:
+        _runtime_state["warmup_seconds"] = await run_blocking(warm_up)
+        _runtime_state["warmup"] = "done"
+    except Exception as e:
+        _runtime_state["warmup"] = "failed"
+        logger.error(f"warmup | Error: {e}", exc_info=True)
+
+def start_background_tasks():
+    """Siapkan folder output dan jalankan task latar (warm-up, prefetch). Dipanggil dari lifespan."""
+    ensure_output_dirs()
+    tasks = []
+    if WARMUP_ON_STARTUP:
+        _runtime_state["warmup"] = "pending"
+        tasks.append(asyncio.create_task(run_warm_up()))
+    if PREFETCH_ENABLED:
+        tasks.append(asyncio.create_task(prefetch_loop()))
+    return tasks
+
 def get_spotify_access_token():
     auth_str = f"{SPOTIFY_CLIENT_ID}:{SPOTIFY_CLIENT_SECRET}"
     b64_auth = base64.b64encode(auth_str.encode()).decode()
@@ -64,22 +1016,77 @@ def get_spotify_access_token():
         "grant_type": "client_credentials"
     }
 
-    response = requests.post(SPOTIFY_TOKEN_URL, headers=headers, data=data)
+    response = spotify_request("POST", SPOTIFY_TOKEN_URL, headers=headers, data=data)
     if response.status_code != 200:
         raise Exception(f"Gagal mendapatkan token: {response.text}")
 
     return response.json()["access_token"]
 
+def spotify_request(method, url, **kwargs):
+    """Request ke Spotify lewat retry + circuit breaker. Respons 429/5xx dicoba ulang; jika tetap
+    gagal setelah semua percobaan, UpstreamUnavailable dilempar (dijawab 503 oleh error_response)."""
+    def send():
+        response = requests.request(method, url, timeout=SPOTIFY_TIMEOUT, **kwargs)
+        if response.status_code == 429 or response.status_code >= 500:
+            raise UpstreamHTTPError(response)
+        return response
+
+    return call_with_retry("spotify", send)
+
+def spotify_get(url, headers, params=None):
+    return spotify_request("GET", url, headers=headers, params=params)
+
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
-    start_time = datetime.now()
-    response = await call_next(request)
-    process_time = (datetime.now() - start_time).microseconds / 1000
-    logger.info(
-        f"IP: {request.client.host}, Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}, "
-        f"Method: {request.method}, URL: {request.url}, "
-        f"Status: {response.status_code}, Process Time: {process_time:.3f} ms"
-    )
+    global _inflight_requests
+    start_time = time.perf_counter()
+    record = {}
+    token = _access_record.set(record)
+    _inflight_requests += 1
+    try:
+        response = await call_next(request)
+    finally:
+        _inflight_requests -= 1
+        _access_record.reset(token)
+
+    path = request.url.path
+    sample_rate = next((rate for prefix, rate in ACCESS_LOG_SAMPLING.items() if path.startswith(prefix)), 1.0)
+    if response.status_code < 400 and sample_rate < 1.0 and random.random() >= sample_rate:
+        return response
+
+    route = request.scope.get("route")
+    record.update({
+        "ip": request.client.host if request.client else None,
+        "method": request.method,
+        "route": getattr(route, "path", path),
+        "path": path,
+        "status": response.status_code,
+        "video_id": media_key(request.query_params.get("url")),
+    })
+    if sample_rate < 1.0:
+        record["sample_rate"] = sample_rate
+
+    def emit(sent_bytes):
+        record["duration_ms"] = round((time.perf_counter() - start_time) * 1000, 3)
+        record["bytes"] = sent_bytes
+        access_logger.info("access", extra={"access": record})
+
+    content_length = response.headers.get("content-length")
+    if content_length:
+        emit(int(content_length))
+        return response
+
+    # Respons streaming tidak punya Content-Length: hitung byte saat body benar-benar dikirim
+    async def counted_body(body_iterator):
+        sent_bytes = 0
+        try:
+            async for chunk in body_iterator:
+                sent_bytes += len(chunk)
+                yield chunk
+        finally:
+            emit(sent_bytes)
+
+    response.body_iterator = counted_body(response.body_iterator)
     return response
 
 @app.get("/", summary="Root Endpoint", description="Menampilkan halaman index.html.")
@@ -89,121 +1096,267 @@ async def root():
         return FileResponse(html_path)
     return JSONResponse(status_code=404, content={"error": "index.html file not found"})
 
+@app.get("/ready", summary="Status kesiapan worker")
+async def readiness():
+    ready = _runtime_state["output_dirs"] and _runtime_state["warmup"] in ("skipped", "done")
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "ready": ready,
+            "uptime": round(time.monotonic() - _started_at, 3),
+            "warmup": _runtime_state["warmup"],
+            "warmup_seconds": _runtime_state["warmup_seconds"],
+            "components": {
+                "yt_dlp": yt_dlp.loaded,
+                "requests": requests.loaded,
+                "cookie_identities": len(_cookie_pool.identities) if _cookie_pool else None,
+                "info_cache_items": len(_info_cache),
+            },
+        }
+    )
+
 @app.get("/search/", summary="Pencarian Video YouTube")
 async def search_video(query: str = Query(..., description="Kata kunci pencarian untuk video YouTube")):
     try:
-        ydl_opts = {'quiet': True, 'cookiefile': COOKIES_FILE}
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            search_result = ydl.extract_info(f"ytsearch5:{query}", download=False)
-            videos = [
-                {"title": v["title"], "url": v["webpage_url"], "id": v["id"]}
-                for v in search_result.get('entries', [])
-                if 'title' in v and 'webpage_url' in v and 'id' in v
-            ]
+        ydl_opts = {'quiet': True}
+
+        search_result = await run_blocking(extract_with_retry, ydl_opts, f"ytsearch5:{query}")
+        videos = [
+            {"title": v["title"], "url": v["webpage_url"], "id": v["id"]}
+            for v in search_result.get('entries', [])
+            if 'title' in v and 'webpage_url' in v and 'id' in v
+        ]
         logger.info(f"search | Query: {query} | Results: {len(videos)}")
         return {"results": videos}
     except Exception as e:
         logger.error(f"search | Query: {query} | Error: {e}")
-        return JSONResponse(status_code=500, content={"error": str(e)})
+        return error_response(e)
+
+def build_info_response(summary, offset=0):
+    """Susun respons /info/ dari InfoSummary atau PlaylistSummary."""
+    if summary.is_playlist:
+        videos = []
+        for idx, entry in enumerate(summary.entries, offset + 1):
+            if entry:
+                playlist_index, title, video_url, duration, thumbnail = entry
+                videos.append({
+                    "index": playlist_index or idx,
+                    "title": title,
+                    "url": video_url,
+                    "duration": duration,
+                    "thumbnail": thumbnail,
+                })
+
+        return {
+            "is_playlist": True,
+            "playlist_id": summary.id,
+            "playlist_title": summary.title,
+            "uploader": summary.uploader,
+            "uploader_url": summary.uploader_url,
+            "webpage_url": summary.webpage_url,
+            "total_videos": len(videos),
+            "playlist_count": summary.playlist_count,
+            "offset": offset,
+            "videos": videos
+        }
+
+    # Jika bukan playlist, tampilkan info video tunggal
+    formats = summary.formats
+    size_bytes = formats.total_mp4_size
+    size_mb = round(size_bytes / 1024 / 1024, 2) if size_bytes else "Unknown"
+    subtitle_languages = list(summary.subtitle_languages)
+
+    return {
+        "is_playlist": False,
+        "title": summary.title,
+        "channel": summary.channel,
+        "channel_url": summary.channel_url,
+        "duration": seconds_to_hms(summary.duration),
+        "size_mb": size_mb,
+        "has_subtitle": bool(subtitle_languages),
+        "subtitle_languages": subtitle_languages,
+        "resolutions": formats.resolutions(),
+        "audio_bitrates": sorted({round(abr) for abr in formats.audio_bitrates if abr}),
+        "thumbnail": summary.thumbnail,
+        "webpage_url": summary.webpage_url,
+    }
 
 @app.get("/info/", summary="Informasi Lengkap Video/Playlist YouTube")
-async def get_info(url: str = Query(..., description="URL video atau playlist YouTube")):
+async def get_info(
+    url: str = Query(..., description="URL video atau playlist YouTube"),
+    flat: bool = Query(False, description="Mode cepat untuk playlist: tidak membuka detail tiap video"),
+    offset: int = Query(0, ge=0, description="Lewati sejumlah entri pertama playlist"),
+    limit: int = Query(None, ge=1, le=500, description="Jumlah maksimal entri playlist yang dikembalikan"),
+    enrich: bool = Query(False, description="Lengkapi detail (durasi, thumbnail) hanya untuk entri yang dikembalikan")
+):
     try:
-        ydl_opts = {'quiet': True, 'cookiefile': COOKIES_FILE}
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
-
-        is_playlist = 'entries' in info
-
-        if is_playlist:
-            video_entries = info.get('entries', [])
-            videos = []
-            for idx, v in enumerate(video_entries, 1):
-                if v:
-                    videos.append({
-                        "index": idx,
-                        "title": v.get("title", "Unknown"),
-                        "url": v.get("webpage_url", "Unknown"),
-                        "duration": v.get("duration", 0),
-                        "thumbnail": v.get("thumbnail"),
+        loop = asyncio.get_running_loop()
+        playlist_items = None
+        if offset or limit:
+            playlist_items = f"{offset + 1}:{offset + limit}" if limit else f"{offset + 1}:"
+
+        with access_stage("extract"):
+            summary = await run_blocking(extract_info_cached, url, flat, playlist_items)
+        result = build_info_response(summary, offset)
+
+        if flat and enrich and result["is_playlist"]:
+            async def enrich_entry(video):
+                try:
+                    detail = await loop.run_in_executor(info_executor, extract_info_cached, video["url"])
+                    video.update({
+                        "title": detail.title or video["title"],
+                        "duration": detail.duration or video["duration"],
+                        "thumbnail": detail.thumbnail or video["thumbnail"],
                     })
+                except Exception as e:
+                    logger.warning(f"info/enrich | URL: {video['url']} | Error: {e}")
 
-            return {
-                "is_playlist": True,
-                "playlist_id": info.get("id"),
-                "playlist_title": info.get("title", "Unknown Playlist"),
-                "uploader": info.get("uploader"),
-                "uploader_url": info.get("uploader_url"),
-                "webpage_url": info.get("webpage_url"),
-                "total_videos": len(videos),
-                "videos": videos
-            }
+            await asyncio.gather(*(enrich_entry(video) for video in result["videos"]))
 
-        # Jika bukan playlist, tampilkan info video tunggal
-        total_duration = info.get("duration", 0)
-        size_bytes = sum(
-            (f.get("filesize") or f.get("filesize_approx") or 0)
-            for f in info.get("formats", [])
-            if f.get("vcodec") != "none" and f.get("ext") == "mp4"
-        )
-        size_mb = round(size_bytes / 1024 / 1024, 2) if size_bytes else "Unknown"
-
-        def seconds_to_hms(seconds):
-            h = seconds // 3600
-            m = (seconds % 3600) // 60
-            s = seconds % 60
-            return f"{int(h):02}:{int(m):02}:{int(s):02}"
-
-        resolutions = []
-        for fmt in info.get("formats", []):
-            if fmt.get("vcodec") != 'none' and fmt.get("height"):
-                size = fmt.get('filesize') or fmt.get('filesize_approx')
-                resolutions.append({
-                    "resolution": f"{fmt['height']}p",
-                    "ext": fmt.get('ext', 'Unknown'),
-                    "size": round(size / 1024 / 1024, 2) if size else "Unknown"
-                })
-        unique_resolutions = list({v['resolution']: v for v in resolutions}.values())
+        return result
+
+    except Exception as e:
+        logger.error(f"info | URL: {url} | Error: {e}", exc_info=True)
+        return error_response(e)
+
+class InfoBatchRequest(BaseModel):
+    urls: List[str]
+
+@app.post("/info/batch", summary="Informasi banyak video sekaligus (NDJSON)")
+async def get_info_batch(payload: InfoBatchRequest):
+    urls = payload.urls
+    if not urls:
+        return JSONResponse(status_code=400, content={"error": "Daftar URL kosong."})
+    if len(urls) > INFO_BATCH_MAX_URLS:
+        return JSONResponse(status_code=400, content={"error": f"Maksimal {INFO_BATCH_MAX_URLS} URL per batch."})
+
+    loop = asyncio.get_running_loop()
+    # URL yang sama cukup diekstrak sekali; hasilnya dikirim untuk setiap index yang memintanya
+    indexes_by_url = {}
+    for idx, url in enumerate(urls):
+        indexes_by_url.setdefault(url, []).append(idx)
+
+    def extract_one(url):
+        try:
+            summary = extract_info_cached(url)
+            return url, {"ok": True, "data": build_info_response(summary)}
+        except Exception as e:
+            logger.warning(f"info/batch | URL: {url} | Error: {e}")
+            return url, {"ok": False, "error": str(e)}
+
+    async def stream_results():
+        tasks = [loop.run_in_executor(info_executor, extract_one, url) for url in indexes_by_url]
+        try:
+            for done in asyncio.as_completed(tasks):
+                url, result = await done
+                for idx in indexes_by_url[url]:
+                    yield json.dumps({"index": idx, "url": url, **result}, ensure_ascii=False) + "\n"
+        finally:
+            # Klien putus atau stream selesai: batalkan ekstraksi yang belum sempat mulai
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+@app.get("/estimate/", summary="Perkiraan ukuran/durasi unduhan sebelum mengunduh")
+async def estimate_download(
+    url: str = Query(..., description="URL video YouTube"),
+    resolution: Union[Literal["audio"], int] = Query(720, description="Resolusi maksimum, atau 'audio'"),
+    start: str = Query(None, description="Awal klip (detik atau HH:MM:SS)"),
+    end: str = Query(None, description="Akhir klip (detik atau HH:MM:SS)")
+):
+    try:
+        clip_range = parse_clip_range(start, end)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+
+    try:
+        with access_stage("extract"):
+            summary = await run_blocking(extract_info_cached, url)
+        if summary.is_playlist:
+            return JSONResponse(status_code=400, content={"error": "Estimasi hanya untuk video tunggal."})
 
-        subtitles = info.get("subtitles", {})
-        auto_captions = info.get("automatic_captions", {})
-        subtitle_languages = list(set(subtitles.keys()) | set(auto_captions.keys()))
+        target = None if resolution == "audio" else int(resolution)
+        estimate = estimate_download_cost(summary, target, clip_range)
+        reason = check_download_limits(estimate)
 
         return {
-            "is_playlist": False,
-            "title": info.get("title"),
-            "channel": info.get("channel"),
-            "channel_url": info.get("channel_url"),
-            "duration": seconds_to_hms(total_duration),
-            "size_mb": size_mb,
-            "has_subtitle": bool(subtitle_languages),
-            "subtitle_languages": subtitle_languages,
-            "resolutions": unique_resolutions,
-            "thumbnail": info.get("thumbnail"),
-            "webpage_url": info.get("webpage_url"),
+            "title": summary.title,
+            "duration": seconds_to_hms(estimate["duration"]) if estimate["duration"] else "Unknown",
+            "resolution": estimate["resolution"],
+            "size_mb": estimate["size_mb"],
+            "allowed": reason is None,
+            "reason": reason,
+            "suggested_resolution": suggest_resolution(summary, target, clip_range) if reason and target else None,
+            "limits": {
+                "max_download_mb": MAX_DOWNLOAD_MB,
+                "max_duration": seconds_to_hms(MAX_DURATION_SECONDS),
+                "max_playlist_items": MAX_PLAYLIST_ITEMS,
+            },
         }
 
     except Exception as e:
-        logger.error(f"info | URL: {url} | Error: {e}", exc_info=True)
-        return JSONResponse(status_code=500, content={"error": str(e)})
+        logger.error(f"estimate | URL: {url} | Error: {e}", exc_info=True)
+        return error_response(e)
 
 @app.get("/download/", summary="Unduhan Video YouTube")
 async def download_video(
     background_tasks: BackgroundTasks,
     url: str = Query(...),
     resolution: int = Query(720),
-    mode: str = Query("url")
+    mode: str = Query("url"),
+    start: str = Query(None, description="Awal klip (detik atau HH:MM:SS)"),
+    end: str = Query(None, description="Akhir klip (detik atau HH:MM:SS)"),
+    allow_downgrade: bool = Query(False, description="Turunkan resolusi otomatis jika melebihi batas ukuran")
 ):
+    try:
+        clip_range = parse_clip_range(start, end)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+
+    record_media_request(url)
+    prefetched = get_prefetched(url, "mp4") if resolution == 720 and not clip_range else None
+    if prefetched:
+        record_access(prefetch_hit=True)
+        with open(prefetched["path"], "rb") as f:
+            video_buffer = io.BytesIO(f.read())
+        return StreamingResponse(
+            video_buffer,
+            media_type="video/mp4",
+            headers={"Content-Disposition": f"attachment; filename={os.path.basename(prefetched['path'])}"}
+        )
+
     try:
         ydl_opts = {
-            'format': f'bestvideo[height<={resolution}][ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best',
-            'outtmpl': os.path.join(OUTPUT_DIR, '%(title)s_%(resolution)sp.%(ext)s'),
-            'cookiefile': COOKIES_FILE,
-            'merge_output_format': 'mp4'
+            'format': select_video_format(url, resolution),
+            'outtmpl': os.path.join(OUTPUT_DIR, f'%(title)s_%(resolution)sp{clip_suffix(clip_range)}.%(ext)s'),
+            'merge_output_format': 'mp4',
+            'noplaylist': True
         }
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=True)
-            file_path = ydl.prepare_filename(info)
+        apply_clip_range(ydl_opts, clip_range)
+
+        def download():
+            # Ekstrak dulu tanpa unduh supaya batas bisa dicek sebelum ada byte yang diunduh
+            with access_stage("extract"):
+                info = extract_for_download(ydl_opts, url)
+                summary = summarize_info(info)
+            if not summary.is_playlist and get_cached_summary(url) is None:
+                store_info_summary((url, False, None), summary)
+
+            allowed_resolution = enforce_download_limits(summary, resolution, clip_range, allow_downgrade)
+            if allowed_resolution != resolution:
+                ydl_opts['format'] = select_video_format(url, allowed_resolution)
+
+            def process(ydl):
+                # Salinan supaya percobaan ulang memproses info asli, bukan hasil percobaan yang gagal
+                processed = ydl.process_ie_result(dict(info), download=True)
+                requested = processed.get('requested_downloads') or [{}]
+                return requested[0].get('filepath') or ydl.prepare_filename(processed)
+
+            with access_stage("download"):
+                return youtube_with_retry(ydl_opts, process)
+
+        file_path = await run_blocking(download)
 
         if not os.path.exists(file_path):
             raise FileNotFoundError(f"File tidak ditemukan setelah unduhan: {file_path}")
@@ -219,12 +1372,17 @@ async def download_video(
             headers={"Content-Disposition": f"attachment; filename={os.path.basename(file_path)}"}
             )
 
+    except PlaylistNotSupported as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    except DownloadLimitExceeded as e:
+        logger.warning(f"download | URL: {url} | Ditolak: {e}")
+        return JSONResponse(status_code=413, content={"error": str(e)})
     except yt_dlp.utils.DownloadError as e:
         logger.error(f"download | URL: {url} | yt_dlp Error: {e}")
-        return JSONResponse(status_code=500, content={"error": str(e)})
+        return error_response(e)
     except Exception as e:
         logger.error(f"download | URL: {url} | General Error: {e}")
-        return JSONResponse(status_code=500, content={"error": str(e)})
+        return error_response(e)
         
 @app.get("/download/ytsub", summary="Unduh video dengan subtitle digabung")
 async def download_with_subtitle(
@@ -242,75 +1400,74 @@ async def download_with_subtitle(
         result = {}
 
         def download():
-            with yt_dlp.YoutubeDL({'quiet': True, 'cookiefile': COOKIES_FILE}) as ydl_info:
-                info = ydl_info.extract_info(url, download=False)
-                title = info.get("title", "video").replace("/", "_").replace("\\", "_")
-                filename_base = f"ytsubbynvl-{title}-{resolution}p-{lang}"
-                final_filename = f"{filename_base}.mp4"
-                final_filepath = os.path.join(OUTPUT_DIR, final_filename)
-
-                if os.path.exists(final_filepath):
-                    file_size_mb = round(os.path.getsize(final_filepath) / (1024 * 1024), 2)
-                    result.update({
-                        "title": title,
-                        "thumbnail": info.get("thumbnail"),
-                        "size_mb": file_size_mb,
-                        "download_url": f"https://ytdlpyton.nvlgroup.my.id/download/file/{quote(final_filename)}"
-                    })
-                    background_tasks.add_task(delete_file_after_delay, final_filepath)
-                    return
-
-                ydl_opts = {
-                    'quiet': True,
-                    'cookiefile': COOKIES_FILE,
-                    'writesubtitles': True,
-                    'writeautomaticsub': True,
-                    'subtitleslangs': [lang],
-                    'skip_download': False,
-                    'outtmpl': os.path.join(OUTPUT_DIR, filename_base + '.%(ext)s'),
-                    'format': f'bestvideo[height<={resolution}][ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]',
-                    'merge_output_format': 'mp4',
-                    'postprocessors': [
-                        {'key': 'FFmpegSubtitlesConvertor', 'format': 'srt'},
-                        {'key': 'FFmpegVideoConvertor', 'preferedformat': 'mp4'}
-                    ]
-                }
+            info = extract_for_download({'quiet': True, 'noplaylist': True}, url)
+            enforce_download_limits(summarize_info(info), resolution)
+            title = info.get("title", "video").replace("/", "_").replace("\\", "_")
+            filename_base = f"ytsubbynvl-{title}-{resolution}p-{lang}"
+            final_filename = f"{filename_base}.mp4"
+            final_filepath = os.path.join(OUTPUT_DIR, final_filename)
+
+            if os.path.exists(final_filepath):
+                file_size_mb = round(os.path.getsize(final_filepath) / (1024 * 1024), 2)
+                result.update({
+                    "title": title,
+                    "thumbnail": info.get("thumbnail"),
+                    "size_mb": file_size_mb,
+                    "download_url": f"https://ytdlpyton.nvlgroup.my.id/download/file/{quote(final_filename)}"
+                })
+                background_tasks.add_task(delete_file_after_delay, final_filepath)
+                return
+
+            ydl_opts = {
+                'quiet': True,
+                'writesubtitles': True,
+                'writeautomaticsub': True,
+                'subtitleslangs': [lang],
+                'skip_download': False,
+                'outtmpl': os.path.join(OUTPUT_DIR, filename_base + '.%(ext)s'),
+                'format': f'bestvideo[height<={resolution}][ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]',
+                'merge_output_format': 'mp4',
+                'postprocessors': [
+                    {'key': 'FFmpegSubtitlesConvertor', 'format': 'srt'},
+                    {'key': 'FFmpegVideoConvertor', 'preferedformat': 'mp4'}
+                ]
+            }
 
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    ydl.download([url])
-
-                raw_filepath = os.path.join(OUTPUT_DIR, f"{filename_base}.mp4")
-                subtitle_path = os.path.join(OUTPUT_DIR, f"{filename_base}.{lang}.srt")
-                burned_filepath = os.path.join(OUTPUT_DIR, f"{filename_base}.burned.mp4")
-
-                # Burn subtitle jika ada
-                if os.path.exists(subtitle_path):
-                    ffmpeg_cmd = [
-                        "ffmpeg", "-y",
-                        "-i", raw_filepath,
-                        "-vf", f"subtitles={subtitle_path}:force_style='FontName=Arial,FontSize=24,OutlineColour=&H80000000,BorderStyle=3,Outline=1,Shadow=0'",
-                        "-c:v", "libx264",
-                        "-preset", "faster",    
-                        "-crf", "27",           
-                        "-c:a", "aac",
-                        "-b:a", "96k",
-                        burned_filepath
-                    ]
-                    subprocess.run(ffmpeg_cmd, check=True)
-                    os.remove(raw_filepath)
-                    os.rename(burned_filepath, final_filepath)
-                else:
-                    os.rename(raw_filepath, final_filepath)
-
-                if os.path.exists(final_filepath):
-                    file_size_mb = round(os.path.getsize(final_filepath) / (1024 * 1024), 2)
-                    result.update({
-                        "title": title,
-                        "thumbnail": info.get("thumbnail"),
-                        "size_mb": file_size_mb,
-                        "download_url": f"https://ytdlpyton.nvlgroup.my.id/download/file/{quote(final_filename)}"
-                    })
-                    background_tasks.add_task(delete_file_after_delay, final_filepath)
+            download_with_retry(ydl_opts, [url])
+
+            raw_filepath = os.path.join(OUTPUT_DIR, f"{filename_base}.mp4")
+            subtitle_path = os.path.join(OUTPUT_DIR, f"{filename_base}.{lang}.srt")
+            burned_filepath = os.path.join(OUTPUT_DIR, f"{filename_base}.burned.mp4")
+
+            # Burn subtitle jika ada
+            if os.path.exists(subtitle_path):
+                ffmpeg_cmd = [
+                    "ffmpeg", "-y",
+                    "-i", raw_filepath,
+                    "-vf", f"subtitles={subtitle_path}:force_style='FontName=Arial,FontSize=24,OutlineColour=&H80000000,BorderStyle=3,Outline=1,Shadow=0'",
+                    "-c:v", "libx264",
+                    "-preset", "faster",    
+                    "-crf", "27",           
+                    "-c:a", "aac",
+                    "-b:a", "96k",
+                    burned_filepath
+                ]
+                import subprocess
+                subprocess.run(ffmpeg_cmd, check=True)
+                os.remove(raw_filepath)
+                os.rename(burned_filepath, final_filepath)
+            else:
+                os.rename(raw_filepath, final_filepath)
+
+            if os.path.exists(final_filepath):
+                file_size_mb = round(os.path.getsize(final_filepath) / (1024 * 1024), 2)
+                result.update({
+                    "title": title,
+                    "thumbnail": info.get("thumbnail"),
+                    "size_mb": file_size_mb,
+                    "download_url": f"https://ytdlpyton.nvlgroup.my.id/download/file/{quote(final_filename)}"
+                })
+                background_tasks.add_task(delete_file_after_delay, final_filepath)
 
         await loop.run_in_executor(None, download)
 
@@ -319,24 +1476,57 @@ async def download_with_subtitle(
 
         return result
 
+    except PlaylistNotSupported as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    except DownloadLimitExceeded as e:
+        logger.warning(f"download/with-sub | URL: {url} | Ditolak: {e}")
+        return JSONResponse(status_code=413, content={"error": str(e)})
     except Exception as e:
         logger.error(f"download/with-sub | URL: {url} | Error: {e}", exc_info=True)
-        return JSONResponse(status_code=500, content={"error": str(e)})
+        return error_response(e)
 
 @app.get("/download/audio/", summary="Unduhan Audio YouTube")
 async def download_audio(
     background_tasks: BackgroundTasks,
     url: str = Query(...),
-    mode: str = Query("url")
+    mode: str = Query("url"),
+    start: str = Query(None, description="Awal klip (detik atau HH:MM:SS)"),
+    end: str = Query(None, description="Akhir klip (detik atau HH:MM:SS)")
 ):
     if mode not in ["url", "buffer"]:
         return JSONResponse(status_code=400, content={"error": "Mode unduhan tidak valid. Gunakan 'url' atau 'buffer'."})
 
     try:
+        clip_range = parse_clip_range(start, end)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+
+    record_media_request(url)
+    prefetched = get_prefetched(url, "mp3") if not clip_range else None
+    if prefetched:
+        record_access(prefetch_hit=True)
+        prefetched_filename = os.path.basename(prefetched["path"])
+        if mode == "url":
+            return {
+                "title": prefetched["title"],
+                "thumbnail": prefetched["thumbnail"],
+                "filesize": prefetched["size"],
+                "author": "nauval",
+                "download_url": f"https://ytdlpyton.nvlgroup.my.id/download/file/{quote(prefetched_filename)}"
+            }
+        with open(prefetched["path"], "rb") as f:
+            audio_buffer = io.BytesIO(f.read())
+        return StreamingResponse(
+            audio_buffer,
+            media_type="audio/mp3",
+            headers={"Content-Disposition": f"attachment; filename={prefetched_filename}"}
+        )
+
+    try:
+        suffix = clip_suffix(clip_range)
         ydl_opts = {
-    'outtmpl': os.path.join(OUTPUT_DIR, '%(title)s_audio_downloadbynauval.%(ext)s'),
+    'outtmpl': os.path.join(OUTPUT_DIR, f'%(title)s_audio_downloadbynauval{suffix}.%(ext)s'),
     'format': 'bestaudio/best',
-    'cookiefile': COOKIES_FILE,
     'postprocessors': [{
         'key': 'FFmpegExtractAudio',
         'preferredcodec': 'mp3',
@@ -352,13 +1542,26 @@ async def download_audio(
     'quiet': True,
     'no_warnings': True
 }
+        apply_clip_range(ydl_opts, clip_range)
 
-
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=True)
-
-        output_filename = f"{info['title']}_audio_downloadbynauval.mp3"
-        file_path = os.path.join(OUTPUT_DIR, output_filename)
+        def download():
+            with access_stage("extract"):
+                info = extract_for_download(ydl_opts, url)
+                summary = summarize_info(info)
+            if not summary.is_playlist and get_cached_summary(url) is None:
+                store_info_summary((url, False, None), summary)
+            enforce_download_limits(summary, None, clip_range)
+            with access_stage("download"):
+                return youtube_with_retry(ydl_opts, lambda ydl: ydl.process_ie_result(dict(info), download=True))
+
+        info = await run_blocking(download)
+
+        # Pakai path hasil postprocessor, judul mentah bisa berbeda dari nama file yang disanitasi yt_dlp
+        requested = info.get('requested_downloads') or [{}]
+        file_path = requested[0].get('filepath') or os.path.join(
+            OUTPUT_DIR, f"{info['title']}_audio_downloadbynauval{suffix}.mp3"
+        )
+        output_filename = os.path.basename(file_path)
 
         if not os.path.exists(file_path):
             raise FileNotFoundError("File hasil konversi tidak ditemukan.")
@@ -383,20 +1586,23 @@ async def download_audio(
             headers={"Content-Disposition": f"attachment; filename={os.path.basename(output_filename)}"}
         )
 
+    except PlaylistNotSupported as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    except DownloadLimitExceeded as e:
+        logger.warning(f"menjadi/download/audio | URL: {url} | Ditolak: {e}")
+        return JSONResponse(status_code=413, content={"error": str(e)})
     except yt_dlp.utils.DownloadError as e:
         logger.error(f"menjadi/download/audio | URL: {url} | yt_dlp Error: {e}")
-        return JSONResponse(status_code=500, content={"error": str(e)})
+        return error_response(e)
     except Exception as e:
         logger.error(f"menjadi/download/audio | URL: {url} | General Error: {e}", exc_info=True)
-        return JSONResponse(status_code=500, content={"error": str(e)})
-
-from typing import Union, Literal
+        return error_response(e)
 
 @app.get("/download/playlist", summary="Unduhan Playlist YouTube")
 async def download_playlist(
     background_tasks: BackgroundTasks,
     url: str = Query(...),
-    limit: int = Query(5, ge=1),
+    limit: int = Query(5, ge=1, le=MAX_PLAYLIST_ITEMS),
     resolution: Union[Literal["audio"], int] = Query(
         "720",
         description="Resolusi video maksimum (misalnya 720), atau 'audio' untuk hanya unduhan audio terbaik"
@@ -419,7 +1625,6 @@ async def download_playlist(
 
         ydl_opts = {
             'quiet': True,
-            'cookiefile': COOKIES_FILE,
             'extract_flat': False,
             'playlistend': limit,
             'outtmpl': os.path.join(OUTPUT_DIR, '%(title)s.%(ext)s'),
@@ -428,25 +1633,27 @@ async def download_playlist(
 
         if merge_output:
             ydl_opts['merge_output_format'] = merge_output
+        playlist_guard_opts(ydl_opts)
 
         loop = asyncio.get_running_loop()
         downloaded_files = []
 
-        def download():
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=True)
-                entries = info.get('entries', [])
-                for idx, entry in enumerate(entries, start=1):
-                    filepath = ydl.prepare_filename(entry)
-                    if os.path.exists(filepath):
-                        downloaded_files.append({
-                            "index": idx,
-                            "title": entry.get("title"),
-                            "download_url": f"https://ytdlpyton.nvlgroup.my.id/download/file/{quote(os.path.basename(filepath))}"
-                        })
-                        background_tasks.add_task(delete_file_after_delay, filepath)
+        def download(ydl):
+            # Percobaan ulang melewati file yang sudah selesai diunduh oleh percobaan sebelumnya
+            info = ydl.extract_info(url, download=True)
+            return [(entry, ydl.prepare_filename(entry)) for entry in info.get('entries', [])]
 
-        await loop.run_in_executor(None, download)
+        def download_all():
+            for idx, (entry, filepath) in enumerate(youtube_with_retry(ydl_opts, download), start=1):
+                if os.path.exists(filepath):
+                    downloaded_files.append({
+                        "index": idx,
+                        "title": entry.get("title"),
+                        "download_url": f"https://ytdlpyton.nvlgroup.my.id/download/file/{quote(os.path.basename(filepath))}"
+                    })
+                    background_tasks.add_task(delete_file_after_delay, filepath)
+
+        await loop.run_in_executor(None, download_all)
 
         return {
             "playlist_title": f"Download hasil playlist dari: {url}",
@@ -456,16 +1663,12 @@ async def download_playlist(
 
     except Exception as e:
         logger.error(f"playlist | URL: {url} | Error: {e}", exc_info=True)
-        return JSONResponse(status_code=500, content={"error": str(e)})
+        return error_response(e)
         
-import tempfile
-
-import requests
-
 @app.get("/spotify/search", summary="Cari lagu di Spotify (dengan client ID)")
 async def spotify_search(query: str = Query(..., description="Judul lagu atau artis")):
     try:
-        token = get_spotify_access_token()
+        token = await run_blocking(get_spotify_access_token)
 
         headers = {
             "Authorization": f"Bearer {token}"
@@ -476,7 +1679,7 @@ async def spotify_search(query: str = Query(..., description="Judul lagu atau ar
             "limit": 5
         }
 
-        resp = requests.get(f"{SPOTIFY_API_URL}/search", headers=headers, params=params)
+        resp = await run_blocking(spotify_get, f"{SPOTIFY_API_URL}/search", headers, params)
         data = resp.json()
 
         tracks = data.get("tracks", {}).get("items", [])
@@ -493,11 +1696,11 @@ async def spotify_search(query: str = Query(..., description="Judul lagu atau ar
 
     except Exception as e:
         logger.error(f"spotify_search | Query: {query} | Error: {e}")
-        return JSONResponse(status_code=500, content={"error": str(e)})
+        return error_response(e)
 @app.get("/spotify/info", summary="Info lengkap Spotify URL (track/album/playlist)")
 async def spotify_info(url: str = Query(..., description="URL Spotify track, album, atau playlist")):
     try:
-        token = get_spotify_access_token()
+        token = await run_blocking(get_spotify_access_token)
         headers = {"Authorization": f"Bearer {token}"}
 
         if "track" in url:
@@ -511,7 +1714,7 @@ async def spotify_info(url: str = Query(..., description="URL Spotify track, alb
 
         spotify_id = url.split("/")[-1].split("?")[0]
         endpoint = f"{SPOTIFY_API_URL}/{spotify_type}s/{spotify_id}"
-        resp = requests.get(endpoint, headers=headers)
+        resp = await run_blocking(spotify_get, endpoint, headers)
         if resp.status_code != 200:
             return JSONResponse(status_code=resp.status_code, content={"error": resp.text})
         data = resp.json()
@@ -560,7 +1763,7 @@ async def spotify_info(url: str = Query(..., description="URL Spotify track, alb
                     })
 
             while next_url:
-                next_resp = requests.get(next_url, headers=headers)
+                next_resp = await run_blocking(spotify_get, next_url, headers)
                 next_data = next_resp.json()
                 for item in next_data.get("items", []):
                     track = item.get("track")
@@ -579,7 +1782,7 @@ async def spotify_info(url: str = Query(..., description="URL Spotify track, alb
 
     except Exception as e:
         logger.error(f"spotify_info | URL: {url} | Error: {e}", exc_info=True)
-        return JSONResponse(status_code=500, content={"error": str(e)})
+        return error_response(e)
         
 @app.get("/spotify/download/audio", summary="Unduh audio dari Spotify track (via YouTube)")
 async def spotify_download_from_track(
@@ -591,12 +1794,12 @@ async def spotify_download_from_track(
         return JSONResponse(status_code=400, content={"error": "Hanya mendukung URL Spotify track."})
 
     try:
-        token = get_spotify_access_token()
+        token = await run_blocking(get_spotify_access_token)
         headers = {"Authorization": f"Bearer {token}"}
 
         spotify_id = url.split("/")[-1].split("?")[0]
         endpoint = f"{SPOTIFY_API_URL}/tracks/{spotify_id}"
-        resp = requests.get(endpoint, headers=headers)
+        resp = await run_blocking(spotify_get, endpoint, headers)
         if resp.status_code != 200:
             return JSONResponse(status_code=resp.status_code, content={"error": resp.text})
 
@@ -605,11 +1808,25 @@ async def spotify_download_from_track(
         artist = ", ".join(a["name"] for a in data["artists"])
         search_query = f"{title} {artist} audio"
 
+        if data.get("duration_ms", 0) / 1000 > MAX_DURATION_SECONDS:
+            return JSONResponse(status_code=413, content={"error": f"Durasi lagu melebihi batas {seconds_to_hms(MAX_DURATION_SECONDS)}."})
+
+        record_media_request(url, query=search_query)
+        prefetched = get_prefetched(url, "mp3")
+        if prefetched:
+            record_access(prefetch_hit=True)
+            return {
+                "title": title,
+                "artist": artist,
+                "thumbnail": prefetched["thumbnail"],
+                "download_url": f"https://ytdlpyton.nvlgroup.my.id/download/file/{quote(os.path.basename(prefetched['path']))}"
+            }
+
         ydl_opts = {
             'quiet': True,
-            'cookiefile': COOKIES_FILE,
             'format': 'bestaudio/best',
             'outtmpl': os.path.join(OUTPUT_DIR, '%(title)s_spotify_by_nauval.%(ext)s'),
+            'max_filesize': MAX_DOWNLOAD_MB * 1024 * 1024,
             'postprocessors': [{
                 'key': 'FFmpegExtractAudio',
                 'preferredcodec': 'mp3',
@@ -621,23 +1838,17 @@ async def spotify_download_from_track(
             'no_warnings': True
         }
 
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(f"ytsearch1:{search_query}", download=False)
+        def download():
+            info = extract_with_retry(ydl_opts, f"ytsearch1:{search_query}")
             entry = info['entries'][0] if 'entries' in info else info
 
-            output_filename = f"{entry['title']}_spotify_by_nauval.mp3"
-            file_path = os.path.join(OUTPUT_DIR, output_filename)
-
-            if os.path.exists(file_path):
-                background_tasks.add_task(delete_file_after_delay, file_path)
-                return {
-                    "title": title,
-                    "artist": artist,
-                    "thumbnail": entry.get("thumbnail"),
-                    "download_url": f"https://ytdlpyton.nvlgroup.my.id/download/file/{quote(output_filename)}"
-                }
+            file_path = os.path.join(OUTPUT_DIR, f"{entry['title']}_spotify_by_nauval.mp3")
+            if not os.path.exists(file_path):
+                download_with_retry(ydl_opts, [entry['webpage_url']])
+            return entry, file_path
 
-            ydl.download([entry['webpage_url']])
+        entry, file_path = await run_blocking(download)
+        output_filename = os.path.basename(file_path)
 
         if not os.path.exists(file_path):
             raise FileNotFoundError("File hasil konversi tidak ditemukan.")
@@ -653,12 +1864,12 @@ async def spotify_download_from_track(
 
     except Exception as e:
         logger.error(f"spotify_download_audio | URL: {url} | Error: {e}", exc_info=True)
-        return JSONResponse(status_code=500, content={"error": str(e)})
+        return error_response(e)
 @app.get("/spotify/download/playlist", summary="Unduh playlist Spotify jadi MP3 (via YouTube)")
 async def spotify_download_playlist_audio(
     background_tasks: BackgroundTasks,
     url: str = Query(..., description="URL playlist Spotify"),
-    limit: int = Query(10, ge=1, le=50, description="Jumlah maksimal lagu yang diunduh (1–50)"),
+    limit: int = Query(10, ge=1, le=MAX_PLAYLIST_ITEMS, description=f"Jumlah maksimal lagu yang diunduh (1–{MAX_PLAYLIST_ITEMS})"),
     mode: str = Query("url", description="Saat ini hanya mendukung mode 'url'")
 ):
     if "playlist" not in url:
@@ -667,12 +1878,12 @@ async def spotify_download_playlist_audio(
         return JSONResponse(status_code=400, content={"error": "Mode saat ini hanya mendukung 'url'."})
 
     try:
-        token = get_spotify_access_token()
+        token = await run_blocking(get_spotify_access_token)
         headers = {"Authorization": f"Bearer {token}"}
 
         spotify_id = url.split("/")[-1].split("?")[0]
         endpoint = f"{SPOTIFY_API_URL}/playlists/{spotify_id}"
-        resp = requests.get(endpoint, headers=headers)
+        resp = await run_blocking(spotify_get, endpoint, headers)
         if resp.status_code != 200:
             return JSONResponse(status_code=resp.status_code, content={"error": resp.text})
         data = resp.json()
@@ -686,7 +1897,7 @@ async def spotify_download_playlist_audio(
         while len(all_tracks) < limit:
             for item in tracks_data:
                 track = item.get("track")
-                if track:
+                if track and track.get("duration_ms", 0) / 1000 <= MAX_DURATION_SECONDS:
                     all_tracks.append({
                         "title": track["name"],
                         "artist": ", ".join(artist["name"] for artist in track["artists"])
@@ -694,7 +1905,7 @@ async def spotify_download_playlist_audio(
                 if len(all_tracks) >= limit:
                     break
             if next_url and len(all_tracks) < limit:
-                next_resp = requests.get(next_url, headers=headers)
+                next_resp = await run_blocking(spotify_get, next_url, headers)
                 next_data = next_resp.json()
                 tracks_data = next_data["items"]
                 next_url = next_data.get("next")
@@ -703,9 +1914,9 @@ async def spotify_download_playlist_audio(
 
         ydl_opts = {
             'quiet': True,
-            'cookiefile': COOKIES_FILE,
             'format': 'bestaudio/best',
             'outtmpl': os.path.join(OUTPUT_DIR, '%(title)s_spotify_playlist.%(ext)s'),
+            'max_filesize': MAX_DOWNLOAD_MB * 1024 * 1024,
             'postprocessors': [{
                 'key': 'FFmpegExtractAudio',
                 'preferredcodec': 'mp3',
@@ -721,38 +1932,29 @@ async def spotify_download_playlist_audio(
         downloaded = []
 
         def download_all():
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                for idx, track in enumerate(all_tracks, start=1):
-                    query = f"{track['title']} {track['artist']} audio"
-                    try:
-                        info = ydl.extract_info(f"ytsearch1:{query}", download=False)
-                        entry = info['entries'][0] if 'entries' in info else info
-                        filename = f"{entry['title']}_spotify_playlist.mp3"
-                        filepath = os.path.join(OUTPUT_DIR, filename)
-
-                        if os.path.exists(filepath):
-                            downloaded.append({
-                                "index": idx,
-                                "title": track["title"],
-                                "artist": track["artist"],
-                                "download_url": f"https://ytdlpyton.nvlgroup.my.id/download/file/{quote(filename)}"
-                            })
-                            background_tasks.add_task(delete_file_after_delay, filepath)
-                            continue
-
-                        ydl.download([entry['webpage_url']])
-
-                        if os.path.exists(filepath):
-                            downloaded.append({
-                                "index": idx,
-                                "title": track["title"],
-                                "artist": track["artist"],
-                                "download_url": f"https://ytdlpyton.nvlgroup.my.id/download/file/{quote(filename)}"
-                            })
-                            background_tasks.add_task(delete_file_after_delay, filepath)
-
-                    except Exception as e:
-                        logger.warning(f"Gagal unduh lagu: {query} | Error: {e}")
+            for idx, track in enumerate(all_tracks, start=1):
+                query = f"{track['title']} {track['artist']} audio"
+                try:
+                    info = extract_with_retry(ydl_opts, f"ytsearch1:{query}")
+                    entry = info['entries'][0] if 'entries' in info else info
+                    filename = f"{entry['title']}_spotify_playlist.mp3"
+                    filepath = os.path.join(OUTPUT_DIR, filename)
+
+                    if not os.path.exists(filepath):
+                        # Identitas diambil per lagu (dan per percobaan), identitas yang didinginkan tidak dipakai lagi
+                        download_with_retry(ydl_opts, [entry['webpage_url']])
+
+                    if os.path.exists(filepath):
+                        downloaded.append({
+                            "index": idx,
+                            "title": track["title"],
+                            "artist": track["artist"],
+                            "download_url": f"https://ytdlpyton.nvlgroup.my.id/download/file/{quote(filename)}"
+                        })
+                        background_tasks.add_task(delete_file_after_delay, filepath)
+
+                except Exception as e:
+                    logger.warning(f"Gagal unduh lagu: {query} | Error: {e}")
 
         await loop.run_in_executor(None, download_all)
 
@@ -764,25 +1966,23 @@ async def spotify_download_playlist_audio(
 
     except Exception as e:
         logger.error(f"spotify_download_playlist | URL: {url} | Error: {e}", exc_info=True)
-        return JSONResponse(status_code=500, content={"error": str(e)})
-from zipfile import ZipFile
-
+        return error_response(e)
 @app.get("/spotify/fullplaylist", summary="Unduh full playlist Spotify (MP3) dengan opsi ZIP/GDrive")
 async def spotify_full_playlist_download(
     background_tasks: BackgroundTasks,
     url: str = Query(..., description="URL Spotify playlist"),
-    limit: int = Query(10, ge=1, le=50),
+    limit: int = Query(10, ge=1, le=MAX_PLAYLIST_ITEMS),
     mode: str = Query("zip", description="Mode: url, zip")
 ):
     if "playlist" not in url:
         return JSONResponse(status_code=400, content={"error": "Hanya URL playlist Spotify yang didukung."})
 
     try:
-        token = get_spotify_access_token()
+        token = await run_blocking(get_spotify_access_token)
         headers = {"Authorization": f"Bearer {token}"}
         spotify_id = url.split("/")[-1].split("?")[0]
         endpoint = f"{SPOTIFY_API_URL}/playlists/{spotify_id}"
-        resp = requests.get(endpoint, headers=headers)
+        resp = await run_blocking(spotify_get, endpoint, headers)
         if resp.status_code != 200:
             return JSONResponse(status_code=resp.status_code, content={"error": resp.text})
         data = resp.json()
@@ -795,7 +1995,7 @@ async def spotify_full_playlist_download(
         while len(all_tracks) < limit:
             for item in tracks_data:
                 track = item.get("track")
-                if track:
+                if track and track.get("duration_ms", 0) / 1000 <= MAX_DURATION_SECONDS:
                     all_tracks.append({
                         "title": track["name"],
                         "artist": ", ".join(artist["name"] for artist in track["artists"])
@@ -803,7 +2003,7 @@ async def spotify_full_playlist_download(
                 if len(all_tracks) >= limit:
                     break
             if next_url and len(all_tracks) < limit:
-                next_resp = requests.get(next_url, headers=headers)
+                next_resp = await run_blocking(spotify_get, next_url, headers)
                 next_data = next_resp.json()
                 tracks_data = next_data["items"]
                 next_url = next_data.get("next")
@@ -812,9 +2012,9 @@ async def spotify_full_playlist_download(
 
         ydl_opts = {
             'quiet': True,
-            'cookiefile': COOKIES_FILE,
             'format': 'bestaudio/best',
             'outtmpl': os.path.join(OUTPUT_DIR, '%(title)s_spotifyfull.%(ext)s'),
+            'max_filesize': MAX_DOWNLOAD_MB * 1024 * 1024,
             'postprocessors': [{
                 'key': 'FFmpegExtractAudio',
                 'preferredcodec': 'mp3',
@@ -830,23 +2030,22 @@ async def spotify_full_playlist_download(
         downloaded_files = []
 
         def download_tracks():
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                for track in all_tracks:
-                    query = f"{track['title']} {track['artist']} audio"
-                    try:
-                        info = ydl.extract_info(f"ytsearch1:{query}", download=False)
-                        entry = info['entries'][0] if 'entries' in info else info
-                        filename = f"{entry['title']}_spotifyfull.mp3"
-                        filepath = os.path.join(OUTPUT_DIR, filename)
-
-                        if not os.path.exists(filepath):
-                            ydl.download([entry['webpage_url']])
-                        if os.path.exists(filepath):
-                            downloaded_files.append(filepath)
-                            background_tasks.add_task(delete_file_after_delay, filepath)
-
-                    except Exception as e:
-                        logger.warning(f"Gagal unduh: {query} | Error: {e}")
+            for track in all_tracks:
+                query = f"{track['title']} {track['artist']} audio"
+                try:
+                    info = extract_with_retry(ydl_opts, f"ytsearch1:{query}")
+                    entry = info['entries'][0] if 'entries' in info else info
+                    filename = f"{entry['title']}_spotifyfull.mp3"
+                    filepath = os.path.join(OUTPUT_DIR, filename)
+
+                    if not os.path.exists(filepath):
+                        download_with_retry(ydl_opts, [entry['webpage_url']])
+                    if os.path.exists(filepath):
+                        downloaded_files.append(filepath)
+                        background_tasks.add_task(delete_file_after_delay, filepath)
+
+                except Exception as e:
+                    logger.warning(f"Gagal unduh: {query} | Error: {e}")
 
         await loop.run_in_executor(None, download_tracks)
 
@@ -865,6 +2064,8 @@ async def spotify_full_playlist_download(
             zip_name = f"{playlist_title.replace(' ', '_')}_spotify.zip"
             zip_path = os.path.join(OUTPUT_DIR, zip_name)
 
+            from zipfile import ZipFile
+
             with ZipFile(zip_path, "w") as zipf:
                 for file in downloaded_files:
                     zipf.write(file, arcname=os.path.basename(file))
@@ -882,7 +2083,7 @@ async def spotify_full_playlist_download(
 
     except Exception as e:
         logger.error(f"spotify_fullplaylist | URL: {url} | Error: {e}", exc_info=True)
-        return JSONResponse(status_code=500, content={"error": str(e)})
+        return error_response(e)
         
 @app.get("/download/file/{filename}", summary="Mengunduh file hasil")
 async def download_file(filename: str):